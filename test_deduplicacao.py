@@ -0,0 +1,26 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import versao_NP
+import versao_P
+
+
+@pytest.mark.parametrize("modulo", [versao_P, versao_NP])
+def test_ids_grandes_distintos_nao_colidem(modulo):
+    """Números de processo acima de 2**53 não podem perder precisão antes do hash."""
+    df_1 = pd.DataFrame({'sigla_tribunal': 'TJAC', 'id': [10**17 + i for i in range(3)]})
+    df_2 = pd.DataFrame({'sigla_tribunal': 'TJAC', 'id': [10**17 + i for i in range(3, 6)]})
+
+    hashes = np.concatenate((modulo._hashes_das_linhas(df_1), modulo._hashes_das_linhas(df_2)))
+    assert len(np.unique(hashes)) == 6
+
+
+@pytest.mark.parametrize("modulo", [versao_P, versao_NP])
+def test_mesmo_registro_int_e_float_tem_o_mesmo_hash(modulo):
+    """Um reenvio com a coluna lida como float64 (por causa de um vazio) ainda casa com o original."""
+    df_int = pd.DataFrame({'sigla_tribunal': ['TJAC', 'TJAC'], 'julgados_2025': [1, 2]})
+    df_float = pd.DataFrame({'sigla_tribunal': ['TJAC', 'TJAC', 'TJAC'], 'julgados_2025': [1.0, 2.0, np.nan]})
+
+    hashes_float = modulo._hashes_das_linhas(df_float)
+    assert (modulo._hashes_das_linhas(df_int) == hashes_float[:2]).all()
@@ -1,15 +1,30 @@
 import pandas as pd
+import numpy as np
 import matplotlib.pyplot as plt
 import glob
+import html
 import os
 import time
-from typing import Dict, List, Optional, Callable
+from typing import Dict, List, Optional, Callable, Tuple
 
 # --- Configuração Inicial ---
 DIRETORIO_DADOS_FONTE = "./Dados"
 DIRETORIO_SAIDA = "./Saida"
 NOME_ARQUIVO_CONSOLIDADO = "Consolidado.csv"
 NOME_ARQUIVO_RESUMO_METAS = "ResumoMetas.csv"
+NOME_ARQUIVO_RELATORIO_HTML = "RelatorioMetas.html"
+
+# Formato da saída visual: "png" (um gráfico matplotlib por métrica) ou
+# "html" (um único relatório com SVG embutido, gerado direto do resumo).
+FORMATO_GRAFICOS = "png"
+
+# Deduplicação de registros reenviados em mais de um arquivo. Cada linha vira um hash
+# de 64 bits, calculado sobre as colunas-chave abaixo (None = todas as colunas).
+# Linhas repetidas dentro de um mesmo arquivo são mantidas, a não ser que
+# DEDUPLICAR_DENTRO_DO_ARQUIVO também seja ligado.
+DEDUPLICAR_REGISTROS = False
+DEDUPLICAR_DENTRO_DO_ARQUIVO = False
+COLUNAS_CHAVE_DEDUPLICACAO: Optional[List[str]] = None
 
 # Nomes das colunas usadas nos cálculos
 COLUNA_CASOS_JULGADOS_2025 = 'julgados_2025'
@@ -25,6 +40,81 @@ TODAS_COLUNAS_METRICAS = [
 ]
 
 # --- 1. Carregamento e Consolidação de Dados ---
+def _normalizar_coluna_chave(coluna: pd.Series) -> pd.Series:
+    """
+    Coloca uma coluna-chave num tipo canônico antes do hash, que depende do tipo: o mesmo
+    registro lido como int64 num arquivo e como float64 em outro (ex.: por causa de um
+    valor vazio) teria hashes diferentes. Inteiros e floats com valores inteiros viram
+    Int64 sem passar por float, para não perder precisão em números de processo grandes.
+    """
+    if pd.api.types.is_bool_dtype(coluna) or pd.api.types.is_integer_dtype(coluna):
+        return coluna.astype('Int64')
+    if pd.api.types.is_float_dtype(coluna):
+        valores = coluna.dropna()
+        limite = float(np.iinfo(np.int64).max)
+        if (valores == np.floor(valores)).all() and (valores.abs() < limite).all():
+            return coluna.astype('Int64')
+        return coluna.astype('float64')
+    return coluna.astype(str)
+
+def _hashes_das_linhas(df: pd.DataFrame) -> np.ndarray:
+    """Calcula um hash de 64 bits por linha, usando as colunas-chave configuradas (ou todas)."""
+    colunas = COLUNAS_CHAVE_DEDUPLICACAO or sorted(df.columns)
+    df_chave = pd.DataFrame({coluna: _normalizar_coluna_chave(df[coluna]) for coluna in colunas})
+    return pd.util.hash_pandas_object(df_chave, index=False).to_numpy(dtype=np.uint64)
+
+def _contar_por_tribunal(df: pd.DataFrame, mascara: np.ndarray, contagem: Dict[str, int]):
+    """Acumula em 'contagem' quantas linhas marcadas na máscara pertencem a cada tribunal."""
+    if not mascara.any():
+        return
+    if 'sigla_tribunal' not in df.columns:
+        contagem['(sem sigla)'] = contagem.get('(sem sigla)', 0) + int(mascara.sum())
+        return
+    for sigla, quantidade in df.loc[mascara, 'sigla_tribunal'].value_counts().items():
+        contagem[sigla] = contagem.get(sigla, 0) + int(quantidade)
+
+def _preparar_deduplicacao(df: pd.DataFrame) -> Tuple[pd.DataFrame, np.ndarray, Dict[str, int]]:
+    """
+    Calcula os hashes das linhas de um arquivo. Só com DEDUPLICAR_DENTRO_DO_ARQUIVO as
+    linhas repetidas no próprio arquivo são descartadas; por padrão elas são mantidas.
+    """
+    hashes = _hashes_das_linhas(df)
+    contagem: Dict[str, int] = {}
+    if not DEDUPLICAR_DENTRO_DO_ARQUIVO:
+        return df, hashes, contagem
+
+    _, indices_primeiros = np.unique(hashes, return_index=True)
+    manter = np.zeros(len(hashes), dtype=bool)
+    manter[indices_primeiros] = True
+    _contar_por_tribunal(df, ~manter, contagem)
+    return df.loc[manter].reset_index(drop=True), hashes[manter], contagem
+
+def _remover_duplicados_globais(df: pd.DataFrame, hashes: np.ndarray, hashes_vistos: np.ndarray,
+                                contagem: Dict[str, int]) -> Tuple[pd.DataFrame, np.ndarray]:
+    """
+    Descarta as linhas cujo hash já apareceu em arquivos anteriores. 'hashes_vistos' é um
+    array ordenado de uint64; a busca é binária e os novos hashes são intercalados nele.
+    """
+    ja_vistos = np.zeros(len(hashes), dtype=bool)
+    if len(hashes_vistos):
+        posicoes = np.minimum(np.searchsorted(hashes_vistos, hashes), len(hashes_vistos) - 1)
+        ja_vistos = hashes_vistos[posicoes] == hashes
+
+    _contar_por_tribunal(df, ja_vistos, contagem)
+    # np.unique já devolve ordenado; repetições internas do arquivo entram uma vez só
+    hashes_vistos = np.concatenate((hashes_vistos, np.unique(hashes[~ja_vistos])))
+    hashes_vistos.sort(kind='mergesort')
+    return df.loc[~ja_vistos].reset_index(drop=True), hashes_vistos
+
+def _exibir_duplicados(contagem: Dict[str, int]):
+    """Mostra o total de registros duplicados descartados, separado por tribunal."""
+    if not contagem:
+        print("🧹 Deduplicação: nenhum registro repetido encontrado.")
+        return
+    print(f"🧹 Deduplicação: {sum(contagem.values())} registros repetidos descartados.")
+    for sigla, quantidade in sorted(contagem.items(), key=lambda item: item[1], reverse=True):
+        print(f"   • {sigla}: {quantidade}")
+
 def consolidar_arquivos_csv(caminho_fonte: str, caminho_saida_arquivo: str) -> Optional[pd.DataFrame]:
     """
     Lê todos os arquivos CSV que correspondem a 'teste_*.csv' de um diretório de origem,
@@ -46,15 +136,31 @@ def consolidar_arquivos_csv(caminho_fonte: str, caminho_saida_arquivo: str) -> O
         return None
 
     lista_dataframes = []
+    hashes_vistos = np.empty(0, dtype=np.uint64)
+    duplicados_por_tribunal: Dict[str, int] = {}
     for arquivo in arquivos_csv:
         try:
             df_temporario = pd.read_csv(arquivo, sep=',', encoding='utf-8')
             if 'sigla_tribunal' not in df_temporario.columns or 'ramo_justica' not in df_temporario.columns:
                 print(f"😬 Alerta! O arquivo '{arquivo}' não tem as colunas 'sigla_tribunal' ou 'ramo_justica'. Isso pode dar ruim depois, hein?")
-            lista_dataframes.append(df_temporario)
-            print(f"👍 Arquivo '{arquivo}' carregado com sucesso!")
         except Exception as e:
             print(f"🚨 Erro feio ao tentar ler o arquivo '{arquivo}': {e}")
+            continue
+
+        if DEDUPLICAR_REGISTROS:
+            try:
+                df_temporario, hashes, contagem_local = _preparar_deduplicacao(df_temporario)
+                for sigla, quantidade in contagem_local.items():
+                    duplicados_por_tribunal[sigla] = duplicados_por_tribunal.get(sigla, 0) + quantidade
+                df_temporario, hashes_vistos = _remover_duplicados_globais(
+                    df_temporario, hashes, hashes_vistos, duplicados_por_tribunal)
+            except KeyError as e:
+                print(f"😬 Alerta! O arquivo '{arquivo}' não tem as colunas-chave {e}. Ele não será deduplicado.")
+        lista_dataframes.append(df_temporario)
+        print(f"👍 Arquivo '{arquivo}' carregado com sucesso!")
+
+    if DEDUPLICAR_REGISTROS:
+        _exibir_duplicados(duplicados_por_tribunal)
 
     if not lista_dataframes:
         print("❌ Deu ruim! Nenhum dataframe foi carregado. Não dá pra continuar a consolidação.")
@@ -351,6 +457,97 @@ def gerar_graficos_resumo(df_resumo: Optional[pd.DataFrame], caminho_saida: str)
     tempo_fim = time.time()
     print(f"⏱️ A geração de gráficos levou {tempo_fim - tempo_inicio:.2f} segundos.")
 
+def _svg_top_tribunais(df_plot: pd.DataFrame, nome_metrica: str) -> str:
+    """Monta um gráfico de barras horizontais em SVG para o Top N de uma métrica."""
+    altura_barra, espaco, margem_rotulo, largura_util = 22, 6, 90, 560
+    maior_valor = max(df_plot[nome_metrica].max(), 0)
+    altura_total = len(df_plot) * (altura_barra + espaco) + espaco
+
+    elementos = []
+    for posicao, (tribunal, valor) in enumerate(zip(df_plot['tribunal'], df_plot[nome_metrica])):
+        y = espaco + posicao * (altura_barra + espaco)
+        largura = (max(valor, 0) / maior_valor) * largura_util if maior_valor > 0 else 0
+        rotulo = html.escape(str(tribunal))
+        elementos.append(
+            f'<text x="{margem_rotulo - 6}" y="{y + 16}" text-anchor="end">{rotulo}</text>'
+            f'<rect x="{margem_rotulo}" y="{y}" width="{largura:.1f}" height="{altura_barra}" fill="#007ACC"/>'
+            f'<text x="{margem_rotulo + largura + 4:.1f}" y="{y + 16}">{valor:.2f}</text>'
+        )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{margem_rotulo + largura_util + 70}" '
+        f'height="{altura_total}" font-family="sans-serif" font-size="12">'
+        + "".join(elementos) + '</svg>'
+    )
+
+def gerar_relatorio_html(df_resumo: Optional[pd.DataFrame], caminho_saida: str, top_n_tribunais: int = 15):
+    """
+    Gera um único relatório HTML autocontido com todas as colunas de Meta.
+    Cada Meta ganha um gráfico SVG com o Top N e uma tabela com o ranking completo,
+    escritos como texto a partir do resumo, sem passar pelo matplotlib.
+
+    Argumentos:
+        df_resumo: O DataFrame contendo o resumo final das métricas.
+        caminho_saida: O diretório onde o relatório HTML será salvo.
+        top_n_tribunais: Quantidade de tribunais exibidos no gráfico de cada Meta.
+    """
+    tempo_inicio = time.time()
+    if df_resumo is None or df_resumo.empty:
+        print("🤔 O DataFrame de resumo de métricas está vazio. Vou pular a geração do relatório.")
+        return
+
+    try:
+        os.makedirs(caminho_saida, exist_ok=True)
+    except OSError as e:
+        print(f"❌ Erro ao criar o diretório '{caminho_saida}': {e}. O relatório não será salvo.")
+        return
+
+    metricas_para_relatorio = [coluna for coluna in TODAS_COLUNAS_METRICAS
+                               if coluna.startswith('Meta') and coluna in df_resumo.columns]
+    secoes = []
+    for nome_metrica in metricas_para_relatorio:
+        df_metrica = df_resumo[['tribunal', nome_metrica]].copy()
+        df_metrica[nome_metrica] = pd.to_numeric(df_metrica[nome_metrica], errors='coerce')
+        df_metrica = df_metrica.dropna(subset=[nome_metrica])
+        df_metrica = df_metrica.sort_values(by=nome_metrica, ascending=False)
+
+        if df_metrica.empty:
+            secoes.append(f'<h2>{nome_metrica}</h2><p>Nenhum dado válido disponível.</p>')
+            continue
+
+        linhas_ranking = "".join(
+            f'<tr><td>{posicao}</td><td>{html.escape(str(tribunal))}</td><td>{valor:.2f}</td></tr>'
+            for posicao, (tribunal, valor) in enumerate(zip(df_metrica['tribunal'], df_metrica[nome_metrica]), start=1)
+        )
+        secoes.append(
+            f'<h2>{nome_metrica}</h2>'
+            f'<h3>Top {top_n_tribunais} Tribunais</h3>'
+            f'{_svg_top_tribunais(df_metrica.head(top_n_tribunais), nome_metrica)}'
+            f'<details><summary>Ranking completo ({len(df_metrica)} tribunais)</summary>'
+            f'<table><tr><th>#</th><th>Tribunal</th><th>{nome_metrica}</th></tr>{linhas_ranking}</table>'
+            f'</details>'
+        )
+
+    documento = (
+        '<!DOCTYPE html><html lang="pt-BR"><head><meta charset="utf-8">'
+        '<title>Relatório de Metas</title>'
+        '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}'
+        'td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}</style>'
+        '</head><body><h1>Comparativo de Performance dos Tribunais</h1>'
+        + "".join(secoes) + '</body></html>'
+    )
+
+    caminho_relatorio = os.path.join(caminho_saida, NOME_ARQUIVO_RELATORIO_HTML)
+    try:
+        with open(caminho_relatorio, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(documento)
+        print(f"📊 Relatório '{caminho_relatorio}' gerado com {len(metricas_para_relatorio)} métricas.")
+    except Exception as e:
+        print(f"💥 Erro ao salvar o relatório '{caminho_relatorio}': {e}")
+
+    tempo_fim = time.time()
+    print(f"⏱️ A geração do relatório HTML levou {tempo_fim - tempo_inicio:.2f} segundos.")
+
 # --- Bloco de Execução Principal ---
 if __name__ == "__main__":
     tempo_inicio_total = time.time()
@@ -374,7 +571,10 @@ if __name__ == "__main__":
 
     # Passo 3: Gerar gráficos visuais a partir do resumo de métricas
     if dados_resumo_metricas is not None:
-        gerar_graficos_resumo(dados_resumo_metricas, DIRETORIO_SAIDA)
+        if FORMATO_GRAFICOS == "html":
+            gerar_relatorio_html(dados_resumo_metricas, DIRETORIO_SAIDA)
+        else:
+            gerar_graficos_resumo(dados_resumo_metricas, DIRETORIO_SAIDA)
     else:
         print("🤔 O resumo de métricas não foi gerado, então não posso criar os gráficos.")
 
@@ -1,11 +1,22 @@
+import argparse
+import codecs
+import contextlib
+import csv
 import pandas as pd
+import numpy as np
 import matplotlib
 # IMPORTANTE: Mude o backend do Matplotlib ANTES de importar o pyplot.
 # O backend 'Agg' é não-interativo e seguro para scripts.
 matplotlib.use('Agg')
 import matplotlib.pyplot as plt
 import glob
+import html
+import io
+import json
+import math
 import os
+import random
+import re
 import time
 from typing import Dict, List, Optional, Callable, Tuple
 import concurrent.futures
@@ -17,6 +28,43 @@ DIRETORIO_DADOS_FONTE = "./Dados"
 DIRETORIO_SAIDA = "./Saida"
 NOME_ARQUIVO_CONSOLIDADO = "Consolidado.csv"
 NOME_ARQUIVO_RESUMO_METAS = "ResumoMetas.csv"
+NOME_ARQUIVO_RELATORIO_HTML = "RelatorioMetas.html"
+NOME_ARQUIVO_PREVIA_METAS = "PreviaMetas.csv"
+
+# Formato da saída visual: "png" (um gráfico matplotlib por métrica) ou
+# "html" (um único relatório com SVG embutido, gerado direto do resumo).
+FORMATO_GRAFICOS = "png"
+
+# Deduplicação de registros reenviados em mais de um arquivo. Cada linha vira um hash
+# de 64 bits, calculado sobre as colunas-chave abaixo (None = todas as colunas).
+# Linhas repetidas dentro de um mesmo arquivo são mantidas, a não ser que
+# DEDUPLICAR_DENTRO_DO_ARQUIVO também seja ligado.
+DEDUPLICAR_REGISTROS = False
+DEDUPLICAR_DENTRO_DO_ARQUIVO = False
+COLUNAS_CHAVE_DEDUPLICACAO: Optional[List[str]] = None
+
+# Prévia aproximada: lê blocos aleatórios de cada CSV e estima as Metas com intervalo de
+# confiança, refinando até a margem de erro alvo (em pontos da Meta) ou até ler tudo.
+# A execução exata continua em segundo plano enquanto a prévia é calculada.
+MODO_PREVIA = False
+TAMANHO_BLOCO_PREVIA = 256 * 1024  # bytes
+BLOCOS_POR_RODADA_PREVIA = 4
+MARGEM_ERRO_ALVO_PREVIA = 2.0
+Z_CONFIANCA_PREVIA = 1.96  # 95% de confiança
+
+# Orçamento de memória para a leitura dos CSVs (ex.: "4G", "512M"). Com None, usa 75% da
+# memória livre da máquina. Pode ser sobrescrito com --max-memory na linha de comando.
+MEMORIA_MAXIMA: Optional[str] = None
+FATOR_PICO_LEITURA = 2.0  # pico do read_csv em relação ao DataFrame final
+TAMANHO_MINIMO_PEDACO = 16 * 1024 * 1024  # menor pedaço (em memória) ao dividir um arquivo
+
+# Planos de leitura: encoding, separador, cabeçalho e tipos das colunas de cada CSV são
+# detectados no início do arquivo e guardados em cache, indexados pela impressão digital
+# do arquivo (caminho, tamanho e data de modificação), para as próximas execuções.
+NOME_ARQUIVO_PLANOS_LEITURA = "PlanosLeitura.json"
+TAMANHO_AMOSTRA_DETECCAO = 64 * 1024  # bytes
+# Ordem de tentativa dos encodings; o Latin-1 aceita qualquer byte e fecha a lista.
+ENCODINGS_CANDIDATOS = ['utf-8', 'cp1252', 'latin-1']
 
 # Nomes das colunas usadas nos cálculos
 COLUNA_CASOS_JULGADOS_2025 = 'julgados_2025'
@@ -33,22 +81,397 @@ TODAS_COLUNAS_METRICAS = [
 
 # --- 1. Carregamento e Consolidação de Dados (Paralelizado com tqdm) ---
 
-def _ler_csv(arquivo: str) -> Optional[pd.DataFrame]:
-    """Função auxiliar para ler um único arquivo CSV em uma thread."""
+def _normalizar_coluna_chave(coluna: pd.Series) -> pd.Series:
+    """
+    Coloca uma coluna-chave num tipo canônico antes do hash, que depende do tipo: o mesmo
+    registro lido como int64 num arquivo e como float64 em outro (ex.: por causa de um
+    valor vazio) teria hashes diferentes. Inteiros e floats com valores inteiros viram
+    Int64 sem passar por float, para não perder precisão em números de processo grandes.
+    """
+    if pd.api.types.is_bool_dtype(coluna) or pd.api.types.is_integer_dtype(coluna):
+        return coluna.astype('Int64')
+    if pd.api.types.is_float_dtype(coluna):
+        valores = coluna.dropna()
+        limite = float(np.iinfo(np.int64).max)
+        if (valores == np.floor(valores)).all() and (valores.abs() < limite).all():
+            return coluna.astype('Int64')
+        return coluna.astype('float64')
+    return coluna.astype(str)
+
+def _hashes_das_linhas(df: pd.DataFrame) -> np.ndarray:
+    """Calcula um hash de 64 bits por linha, usando as colunas-chave configuradas (ou todas)."""
+    colunas = COLUNAS_CHAVE_DEDUPLICACAO or sorted(df.columns)
+    df_chave = pd.DataFrame({coluna: _normalizar_coluna_chave(df[coluna]) for coluna in colunas})
+    return pd.util.hash_pandas_object(df_chave, index=False).to_numpy(dtype=np.uint64)
+
+def _contar_por_tribunal(df: pd.DataFrame, mascara: np.ndarray, contagem: Dict[str, int]):
+    """Acumula em 'contagem' quantas linhas marcadas na máscara pertencem a cada tribunal."""
+    if not mascara.any():
+        return
+    if 'sigla_tribunal' not in df.columns:
+        contagem['(sem sigla)'] = contagem.get('(sem sigla)', 0) + int(mascara.sum())
+        return
+    for sigla, quantidade in df.loc[mascara, 'sigla_tribunal'].value_counts().items():
+        contagem[sigla] = contagem.get(sigla, 0) + int(quantidade)
+
+def _filtrar_partes(partes: List[pd.DataFrame], manter: np.ndarray, contagem: Dict[str, int]) -> List[pd.DataFrame]:
+    """Aplica às partes de um arquivo uma máscara calculada sobre todas as suas linhas, contando as descartadas."""
+    partes_filtradas = []
+    inicio = 0
+    for parte in partes:
+        mascara = manter[inicio:inicio + len(parte)]
+        inicio += len(parte)
+        _contar_por_tribunal(parte, ~mascara, contagem)
+        partes_filtradas.append(parte if mascara.all() else parte.loc[mascara])
+    return partes_filtradas
+
+def _preparar_deduplicacao(partes: List[pd.DataFrame]) -> Tuple[List[pd.DataFrame], np.ndarray, Dict[str, int]]:
+    """
+    Calcula os hashes das linhas de um arquivo. Só com DEDUPLICAR_DENTRO_DO_ARQUIVO as
+    linhas repetidas no próprio arquivo são descartadas; por padrão elas são mantidas.
+    """
+    hashes = np.concatenate([_hashes_das_linhas(parte) for parte in partes])
+    contagem: Dict[str, int] = {}
+    if not DEDUPLICAR_DENTRO_DO_ARQUIVO:
+        return partes, hashes, contagem
+
+    _, indices_primeiros = np.unique(hashes, return_index=True)
+    manter = np.zeros(len(hashes), dtype=bool)
+    manter[indices_primeiros] = True
+    return _filtrar_partes(partes, manter, contagem), hashes[manter], contagem
+
+def _remover_duplicados_globais(partes: List[pd.DataFrame], hashes: np.ndarray, hashes_vistos: np.ndarray,
+                                contagem: Dict[str, int]) -> Tuple[List[pd.DataFrame], np.ndarray]:
+    """
+    Descarta as linhas cujo hash já apareceu em arquivos anteriores. 'hashes_vistos' é um
+    array ordenado de uint64; a busca é binária e os novos hashes são intercalados nele.
+    """
+    ja_vistos = np.zeros(len(hashes), dtype=bool)
+    if len(hashes_vistos):
+        posicoes = np.minimum(np.searchsorted(hashes_vistos, hashes), len(hashes_vistos) - 1)
+        ja_vistos = hashes_vistos[posicoes] == hashes
+
+    # np.unique já devolve ordenado; repetições internas do arquivo entram uma vez só
+    novos_hashes = np.unique(hashes[~ja_vistos])
+    hashes_vistos = np.concatenate((hashes_vistos, novos_hashes))
+    hashes_vistos.sort(kind='mergesort')
+    return _filtrar_partes(partes, ~ja_vistos, contagem), hashes_vistos
+
+def _exibir_duplicados(contagem: Dict[str, int]):
+    """Mostra o total de registros duplicados descartados, separado por tribunal."""
+    if not contagem:
+        print("🧹 Deduplicação: nenhum registro repetido encontrado.")
+        return
+    print(f"🧹 Deduplicação: {sum(contagem.values())} registros repetidos descartados.")
+    for sigla, quantidade in sorted(contagem.items(), key=lambda item: item[1], reverse=True):
+        print(f"   • {sigla}: {quantidade}")
+
+_planos_leitura: Optional[Dict[str, Dict]] = None
+_trava_planos_leitura = threading.Lock()
+
+def _impressao_digital(arquivo: str) -> str:
+    """Identifica a versão de um arquivo pelo caminho, tamanho e data de modificação."""
+    info = os.stat(arquivo)
+    return f"{os.path.abspath(arquivo)}|{info.st_size}|{info.st_mtime_ns}"
+
+def _carregar_planos_leitura() -> Dict[str, Dict]:
+    """Carrega os planos de leitura salvos em execuções anteriores."""
+    caminho = os.path.join(DIRETORIO_SAIDA, NOME_ARQUIVO_PLANOS_LEITURA)
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+    except (OSError, ValueError) as e:
+        print(f"😬 Alerta! Não consegui ler o cache de planos de leitura '{caminho}': {e}. Vou detectar tudo de novo.")
+        return {}
+
+def _salvar_planos_leitura():
+    """Grava o cache de planos de leitura para as próximas execuções."""
+    caminho = os.path.join(DIRETORIO_SAIDA, NOME_ARQUIVO_PLANOS_LEITURA)
+    with _trava_planos_leitura:
+        if not _planos_leitura:
+            return
+        try:
+            with open(caminho + '.tmp', 'w', encoding='utf-8') as f:
+                json.dump(_planos_leitura, f, ensure_ascii=False, indent=1)
+            os.replace(caminho + '.tmp', caminho)
+        except OSError as e:
+            print(f"💥 Erro ao salvar o cache de planos de leitura em '{caminho}': {e}")
+
+def _detectar_plano_leitura(arquivo: str) -> Dict:
+    """Detecta encoding, separador, cabeçalho e tipos das colunas a partir do início do arquivo."""
+    with open(arquivo, 'rb') as f:
+        amostra = f.read(TAMANHO_AMOSTRA_DETECCAO)
+    if len(amostra) == TAMANHO_AMOSTRA_DETECCAO:
+        # Descarta a última linha, que provavelmente foi cortada no meio
+        amostra = amostra[:amostra.rfind(b'\n') + 1]
+
+    # Arquivos dos sistemas dos tribunais costumam vir em UTF-8 ou Windows-1252/Latin-1
+    candidatos = ENCODINGS_CANDIDATOS
+    if amostra.startswith(codecs.BOM_UTF8):
+        candidatos = ['utf-8-sig'] + ENCODINGS_CANDIDATOS[1:]
+    for candidato in candidatos:
+        try:
+            texto = amostra.decode(candidato)
+            encoding = candidato
+            break
+        except UnicodeDecodeError:
+            continue
+
+    primeira_linha = texto.split('\n', 1)[0]
+    try:
+        trecho = texto[:8192]
+        separador = csv.Sniffer().sniff(trecho, delimiters=',;\t|').delimiter
+        tem_cabecalho = 'sigla_tribunal' in primeira_linha or csv.Sniffer().has_header(trecho)
+    except csv.Error:
+        separador, tem_cabecalho = ',', True
+    # Exportações com ';' geralmente usam a vírgula como separador decimal
+    decimal = ',' if separador != ',' and re.search(r'\d,\d', texto) else '.'
+
+    df_amostra = pd.read_csv(io.StringIO(texto), sep=separador, header=0 if tem_cabecalho else None, decimal=decimal)
+    tipos: Dict[str, str] = {}
+    if tem_cabecalho:
+        for coluna, tipo in df_amostra.dtypes.items():
+            if pd.api.types.is_bool_dtype(tipo):
+                continue
+            if pd.api.types.is_integer_dtype(tipo):
+                tipos[coluna] = 'int64'
+            elif pd.api.types.is_float_dtype(tipo):
+                tipos[coluna] = 'float64'
+            else:
+                tipos[coluna] = 'str'
+        df_amostra = df_amostra.astype(tipos)
+
+    memoria_por_byte = df_amostra.memory_usage(deep=True).sum() / len(amostra) if len(df_amostra) else 1.0
+    return {
+        'encoding': encoding, 'separador': separador, 'cabecalho': tem_cabecalho,
+        'decimal': decimal, 'tipos': tipos, 'memoria_por_byte': float(memoria_por_byte),
+        'bytes_por_linha_disco': len(amostra) / max(1, len(df_amostra)),
+    }
+
+def _obter_plano_leitura(arquivo: str) -> Dict:
+    """
+    Devolve uma cópia do plano de leitura do arquivo, detectando-o só se não estiver no
+    cache. Cada leitura trabalha na própria cópia; correções voltam ao cache com
+    _publicar_plano_leitura.
+    """
+    global _planos_leitura
+    chave = _impressao_digital(arquivo)
+    with _trava_planos_leitura:
+        if _planos_leitura is None:
+            _planos_leitura = _carregar_planos_leitura()
+        plano = _planos_leitura.get(chave)
+    if plano is not None:
+        return dict(plano)
+
+    plano = _detectar_plano_leitura(arquivo)
+    with _trava_planos_leitura:
+        # Remove planos de versões anteriores do mesmo arquivo
+        prefixo = chave.rsplit('|', 2)[0] + '|'
+        for chave_antiga in [c for c in _planos_leitura if c.startswith(prefixo)]:
+            del _planos_leitura[chave_antiga]
+        _planos_leitura[chave] = plano
+    return dict(plano)
+
+def _publicar_plano_leitura(arquivo: str, plano: Dict):
+    """Grava no cache um plano corrigido durante a leitura."""
+    with _trava_planos_leitura:
+        if _planos_leitura is not None:
+            _planos_leitura[_impressao_digital(arquivo)] = dict(plano)
+
+def _descartar_plano_leitura(arquivo: str):
+    """Esquece o plano de um arquivo que falhou, para que seja detectado de novo na próxima vez."""
+    with _trava_planos_leitura:
+        if _planos_leitura:
+            _planos_leitura.pop(_impressao_digital(arquivo), None)
+
+def _argumentos_read_csv(plano: Dict) -> Dict:
+    """Traduz um plano de leitura nos argumentos do pd.read_csv."""
+    return {
+        'sep': plano['separador'], 'encoding': plano['encoding'],
+        'header': 0 if plano['cabecalho'] else None, 'decimal': plano['decimal'],
+        'dtype': plano['tipos'] or None,
+    }
+
+def _corrigir_plano_leitura(plano: Dict, erro: Exception, nome_arquivo: str) -> Optional[str]:
+    """
+    Ajusta o plano depois de uma leitura que falhou porque a amostra não representou o
+    arquivo todo (ex.: bytes Latin-1 depois dos primeiros KB, ou valores vazios numa coluna
+    inteira). Altera só a cópia recebida; quem chama publica o resultado no cache.
+    Devolve a mensagem do ajuste, ou None quando não há mais o que tentar.
+    """
+    if isinstance(erro, UnicodeDecodeError):
+        encoding_atual = 'utf-8' if plano['encoding'] == 'utf-8-sig' else plano['encoding']
+        posicao = ENCODINGS_CANDIDATOS.index(encoding_atual) if encoding_atual in ENCODINGS_CANDIDATOS else -1
+        if posicao + 1 >= len(ENCODINGS_CANDIDATOS):
+            return None
+        encoding_anterior = plano['encoding']
+        plano['encoding'] = ENCODINGS_CANDIDATOS[posicao + 1]
+        return f"O encoding '{encoding_anterior}' não serve para '{nome_arquivo}'; relendo como '{plano['encoding']}'."
+    if isinstance(erro, (ValueError, TypeError)) and plano['tipos']:
+        plano['tipos'] = {}
+        return f"Os tipos detectados não servem para '{nome_arquivo}'; relendo sem eles."
+    return None
+
+def _converter_tamanho_memoria(texto: str) -> int:
+    """Converte textos como '4G', '512M', '1.5GB' ou '2GiB' para um número de bytes."""
+    unidades = {'K': 1024, 'M': 1024 ** 2, 'G': 1024 ** 3, 'T': 1024 ** 4}
+    normalizado = texto.strip().upper().removesuffix('B').removesuffix('I')
+    multiplicador = 1
+    if normalizado and normalizado[-1] in unidades:
+        multiplicador = unidades[normalizado[-1]]
+        normalizado = normalizado[:-1]
+    try:
+        quantidade = int(float(normalizado) * multiplicador)
+    except (ValueError, OverflowError):
+        raise argparse.ArgumentTypeError(f"tamanho de memória inválido: '{texto}' (use, por exemplo, 4G ou 512M)")
+    if quantidade <= 0:
+        raise argparse.ArgumentTypeError(f"o orçamento de memória precisa ser maior que zero: '{texto}'")
+    return quantidade
+
+def _memoria_livre_padrao() -> Optional[int]:
+    """Usa 75% da memória física livre como orçamento padrão, quando o sistema informa esse valor."""
+    try:
+        return int(os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE') * 0.75)
+    except (AttributeError, ValueError, OSError):
+        return None
+
+class GovernadorMemoria:
+    """
+    Controla quanta memória as leituras de CSV podem ocupar ao mesmo tempo. Cada leitura
+    reserva o pico estimado antes de começar e espera enquanto a soma passar do orçamento,
+    o que ajusta a concorrência efetiva ao tamanho dos arquivos.
+    """
+
+    def __init__(self, orcamento_bytes: int):
+        self.orcamento = orcamento_bytes
+        self.em_uso = 0  # pico estimado das leituras em andamento
+        self.retido = 0  # DataFrames já carregados e mantidos para a consolidação
+        self.leituras_ativas = 0
+        self._condicao = threading.Condition()
+
+    def disponivel(self) -> int:
+        with self._condicao:
+            return max(0, self.orcamento - self.em_uso - self.retido)
+
+    @contextlib.contextmanager
+    def reserva(self, quantidade: int):
+        with self._condicao:
+            # Sempre admite ao menos uma leitura, para não travar quando o que já foi
+            # carregado passa do orçamento; nesse caso a leitura fica sequencial.
+            while self.leituras_ativas > 0 and self.em_uso + self.retido + quantidade > self.orcamento:
+                self._condicao.wait()
+            self.em_uso += quantidade
+            self.leituras_ativas += 1
+        try:
+            yield
+        finally:
+            with self._condicao:
+                self.em_uso -= quantidade
+                self.leituras_ativas -= 1
+                self._condicao.notify_all()
+
+    def reter(self, quantidade: int):
+        with self._condicao:
+            self.retido += quantidade
+
+    def liberar(self, quantidade: int):
+        with self._condicao:
+            self.retido -= quantidade
+            self._condicao.notify_all()
+
+def _ler_csv_em_pedacos(arquivo: str, governador: GovernadorMemoria, plano: Dict) -> List[pd.DataFrame]:
+    """
+    Lê um arquivo grande demais para o orçamento em pedaços. O tamanho de cada pedaço é
+    recalculado a partir da memória livre no momento e da largura real das linhas já lidas.
+    As partes são devolvidas separadas e só são juntadas no concat final da consolidação.
+    """
+    bytes_por_linha = plano['memoria_por_byte'] * plano['bytes_por_linha_disco']
+
+    partes = []
+    memoria_retida = 0
+    try:
+        with pd.read_csv(arquivo, iterator=True, **_argumentos_read_csv(plano)) as leitor:
+            while True:
+                memoria_pedaco = max(TAMANHO_MINIMO_PEDACO, governador.disponivel() // 2)
+                linhas = max(1, int(memoria_pedaco / (bytes_por_linha * FATOR_PICO_LEITURA)))
+                with governador.reserva(int(linhas * bytes_por_linha * FATOR_PICO_LEITURA)):
+                    try:
+                        parte = leitor.get_chunk(linhas)
+                    except StopIteration:
+                        break
+                    # Conta a parte como retida antes de liberar a reserva, para que outra
+                    # leitura grande não seja admitida enquanto ela não aparece em lugar nenhum
+                    memoria_parte = int(parte.memory_usage(deep=True).sum())
+                    governador.reter(memoria_parte)
+                    memoria_retida += memoria_parte
+                bytes_por_linha = max(1.0, memoria_parte / max(1, len(parte)))
+                partes.append(parte)
+    except BaseException:
+        # As partes lidas até a falha são descartadas; sem isso a releitura contaria o arquivo duas vezes
+        governador.liberar(memoria_retida)
+        raise
+    return partes
+
+def _ler_csv_com_orcamento(arquivo: str, governador: GovernadorMemoria, plano: Dict) -> List[pd.DataFrame]:
+    """Lê o arquivo inteiro se o pico estimado couber no orçamento; senão, lê em pedaços."""
+    pico_estimado = int(os.path.getsize(arquivo) * plano['memoria_por_byte'] * FATOR_PICO_LEITURA)
+    if pico_estimado > governador.orcamento // 2:
+        return _ler_csv_em_pedacos(arquivo, governador, plano)
+
+    with governador.reserva(pico_estimado):
+        df_temporario = pd.read_csv(arquivo, **_argumentos_read_csv(plano))
+        governador.reter(int(df_temporario.memory_usage(deep=True).sum()))
+    return [df_temporario]
+
+def _ler_csv(arquivo: str, governador: Optional[GovernadorMemoria] = None) -> Optional[List[pd.DataFrame]]:
+    """
+    Função auxiliar para ler um único arquivo CSV em uma thread. Devolve as partes
+    lidas: uma só, a não ser que o arquivo tenha sido dividido pelo governador.
+    """
     thread_id = threading.get_ident()
     try:
-        df_temporario = pd.read_csv(arquivo, sep=',', encoding='utf-8')
-        if 'sigla_tribunal' not in df_temporario.columns or 'ramo_justica' not in df_temporario.columns:
+        plano = _obter_plano_leitura(arquivo)
+        partes = None
+        while partes is None:
+            try:
+                if governador is None:
+                    partes = [pd.read_csv(arquivo, **_argumentos_read_csv(plano))]
+                else:
+                    partes = _ler_csv_com_orcamento(arquivo, governador, plano)
+            except (ValueError, TypeError) as erro:
+                ajuste = _corrigir_plano_leitura(plano, erro, os.path.basename(arquivo))
+                if ajuste is None:
+                    raise
+                print(f"THREAD ID: {thread_id} | 😬 Alerta! {ajuste}")
+                _publicar_plano_leitura(arquivo, plano)
+        if 'sigla_tribunal' not in partes[0].columns or 'ramo_justica' not in partes[0].columns:
             print(f"THREAD ID: {thread_id} | 😬 Alerta! O arquivo '{os.path.basename(arquivo)}' não tem colunas essenciais.")
-        return df_temporario
+        return partes
     except Exception as e:
         print(f"THREAD ID: {thread_id} | 🚨 Erro ao ler '{os.path.basename(arquivo)}': {e}")
+        _descartar_plano_leitura(arquivo)
         return None
 
-def consolidar_arquivos_csv_paralelo(caminho_fonte: str, caminho_saida_arquivo: str) -> Optional[pd.DataFrame]:
+def _ler_csv_deduplicado(arquivo: str, governador: Optional[GovernadorMemoria] = None
+                         ) -> Optional[Tuple[List[pd.DataFrame], Optional[np.ndarray], Dict[str, int]]]:
+    """Lê um CSV em uma thread e já calcula os hashes usados na deduplicação."""
+    partes = _ler_csv(arquivo, governador)
+    if partes is None:
+        return None
+    try:
+        return _preparar_deduplicacao(partes)
+    except KeyError as e:
+        print(f"THREAD ID: {threading.get_ident()} | 😬 Alerta! '{os.path.basename(arquivo)}' não tem as colunas-chave {e}; não será deduplicado.")
+        return partes, None, {}
+
+def consolidar_arquivos_csv_paralelo(caminho_fonte: str, caminho_saida_arquivo: str,
+                                     orcamento_memoria: Optional[int] = None) -> Optional[pd.DataFrame]:
     """
     Lê todos os arquivos CSV de forma paralela com barra de progresso,
-    consolida-os e salva em um novo arquivo CSV.
+    consolida-os e salva em um novo arquivo CSV. Com um orçamento de memória,
+    as leituras só começam enquanto o pico estimado couber nele.
     """
     tempo_inicio = time.time()
     print(f"🔎 Procurando arquivos de origem em '{caminho_fonte}'. Fica de olho!")
@@ -59,19 +482,45 @@ def consolidar_arquivos_csv_paralelo(caminho_fonte: str, caminho_saida_arquivo:
         return None
 
     lista_dataframes = []
+    governador = GovernadorMemoria(orcamento_memoria) if orcamento_memoria else None
+    if governador:
+        print(f"🧮 Orçamento de memória para a leitura: {orcamento_memoria / 1024 ** 3:.2f} GB.")
+    funcao_leitura = _ler_csv_deduplicado if DEDUPLICAR_REGISTROS else _ler_csv
     with concurrent.futures.ThreadPoolExecutor() as executor:
         # Usa tqdm para criar uma barra de progresso para a leitura dos arquivos
-        resultados = list(tqdm(executor.map(_ler_csv, arquivos_csv),
+        resultados = list(tqdm(executor.map(lambda arquivo: funcao_leitura(arquivo, governador), arquivos_csv),
                                total=len(arquivos_csv),
                                desc="Lendo arquivos CSV "))
-        for df in resultados:
-            if df is not None:
-                lista_dataframes.append(df)
+
+    if DEDUPLICAR_REGISTROS:
+        # Cada thread já calculou os hashes do próprio arquivo; aqui eles são mesclados
+        # em ordem, descartando as linhas que já vieram de arquivos anteriores.
+        hashes_vistos = np.empty(0, dtype=np.uint64)
+        duplicados_por_tribunal: Dict[str, int] = {}
+        for resultado in resultados:
+            if resultado is None:
+                continue
+            partes, hashes, contagem_local = resultado
+            for sigla, quantidade in contagem_local.items():
+                duplicados_por_tribunal[sigla] = duplicados_por_tribunal.get(sigla, 0) + quantidade
+            if hashes is not None:
+                partes, hashes_vistos = _remover_duplicados_globais(partes, hashes, hashes_vistos, duplicados_por_tribunal)
+            lista_dataframes.extend(partes)
+        _exibir_duplicados(duplicados_por_tribunal)
+    else:
+        lista_dataframes = [parte for partes in resultados if partes is not None for parte in partes]
+
+    _salvar_planos_leitura()
 
     if not lista_dataframes:
         print("❌ Deu ruim! Nenhum dataframe foi carregado. Não dá pra continuar a consolidação.")
         return None
 
+    # O concat final copia tudo o que foi lido e não há como dividi-lo: o pico é o dobro do
+    # que está retido. Nesse ponto não há outra leitura para segurar, então só avisamos.
+    if governador and 2 * governador.retido > governador.orcamento:
+        print(f"😬 Alerta! Juntar os dados lidos deve usar cerca de {2 * governador.retido / 1024 ** 3:.2f} GB, "
+              f"acima do orçamento de {governador.orcamento / 1024 ** 3:.2f} GB.")
     df_consolidado = pd.concat(lista_dataframes, ignore_index=True)
     try:
         df_consolidado.to_csv(caminho_saida_arquivo, index=False, sep=',', encoding='utf-8')
@@ -353,9 +802,328 @@ def gerar_graficos_resumo(df_resumo: Optional[pd.DataFrame], caminho_saida: str)
     tempo_fim = time.time()
     print(f"⏱️ A geração de gráficos levou {tempo_fim - tempo_inicio:.2f} segundos.")
 
+def _svg_top_tribunais(df_plot: pd.DataFrame, nome_metrica: str) -> str:
+    """Monta um gráfico de barras horizontais em SVG para o Top N de uma métrica."""
+    altura_barra, espaco, margem_rotulo, largura_util = 22, 6, 90, 560
+    maior_valor = max(df_plot[nome_metrica].max(), 0)
+    altura_total = len(df_plot) * (altura_barra + espaco) + espaco
+
+    elementos = []
+    for posicao, (tribunal, valor) in enumerate(zip(df_plot['tribunal'], df_plot[nome_metrica])):
+        y = espaco + posicao * (altura_barra + espaco)
+        largura = (max(valor, 0) / maior_valor) * largura_util if maior_valor > 0 else 0
+        rotulo = html.escape(str(tribunal))
+        elementos.append(
+            f'<text x="{margem_rotulo - 6}" y="{y + 16}" text-anchor="end">{rotulo}</text>'
+            f'<rect x="{margem_rotulo}" y="{y}" width="{largura:.1f}" height="{altura_barra}" fill="#007ACC"/>'
+            f'<text x="{margem_rotulo + largura + 4:.1f}" y="{y + 16}">{valor:.2f}</text>'
+        )
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{margem_rotulo + largura_util + 70}" '
+        f'height="{altura_total}" font-family="sans-serif" font-size="12">'
+        + "".join(elementos) + '</svg>'
+    )
+
+def gerar_relatorio_html(df_resumo: Optional[pd.DataFrame], caminho_saida: str, top_n_tribunais: int = 15):
+    """
+    Gera um único relatório HTML (com SVG embutido) cobrindo todas as Metas,
+    escrito direto a partir do resumo, sem o ciclo de figuras do matplotlib.
+    """
+    tempo_inicio = time.time()
+    if df_resumo is None or df_resumo.empty:
+        print("🤔 O DataFrame de resumo de métricas está vazio. Vou pular a geração do relatório.")
+        return
+
+    try:
+        os.makedirs(caminho_saida, exist_ok=True)
+    except OSError as e:
+        print(f"❌ Erro ao criar o diretório '{caminho_saida}': {e}. O relatório não será salvo.")
+        return
+
+    metricas_para_relatorio = [coluna for coluna in TODAS_COLUNAS_METRICAS
+                               if coluna.startswith('Meta') and coluna in df_resumo.columns]
+    secoes = []
+    for nome_metrica in metricas_para_relatorio:
+        df_metrica = df_resumo[['tribunal', nome_metrica]].copy()
+        df_metrica[nome_metrica] = pd.to_numeric(df_metrica[nome_metrica], errors='coerce')
+        df_metrica = df_metrica.dropna(subset=[nome_metrica])
+        df_metrica = df_metrica.sort_values(by=nome_metrica, ascending=False)
+
+        if df_metrica.empty:
+            secoes.append(f'<h2>{nome_metrica}</h2><p>Nenhum dado válido disponível.</p>')
+            continue
+
+        linhas_ranking = "".join(
+            f'<tr><td>{posicao}</td><td>{html.escape(str(tribunal))}</td><td>{valor:.2f}</td></tr>'
+            for posicao, (tribunal, valor) in enumerate(zip(df_metrica['tribunal'], df_metrica[nome_metrica]), start=1)
+        )
+        secoes.append(
+            f'<h2>{nome_metrica}</h2>'
+            f'<h3>Top {top_n_tribunais} Tribunais</h3>'
+            f'{_svg_top_tribunais(df_metrica.head(top_n_tribunais), nome_metrica)}'
+            f'<details><summary>Ranking completo ({len(df_metrica)} tribunais)</summary>'
+            f'<table><tr><th>#</th><th>Tribunal</th><th>{nome_metrica}</th></tr>{linhas_ranking}</table>'
+            f'</details>'
+        )
+
+    documento = (
+        '<!DOCTYPE html><html lang="pt-BR"><head><meta charset="utf-8">'
+        '<title>Relatório de Metas</title>'
+        '<style>body{font-family:sans-serif;margin:2em}table{border-collapse:collapse}'
+        'td,th{border:1px solid #ccc;padding:2px 8px;text-align:right}</style>'
+        '</head><body><h1>Comparativo de Performance dos Tribunais</h1>'
+        + "".join(secoes) + '</body></html>'
+    )
+
+    caminho_relatorio = os.path.join(caminho_saida, NOME_ARQUIVO_RELATORIO_HTML)
+    try:
+        with open(caminho_relatorio, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(documento)
+        print(f"📊 Relatório '{caminho_relatorio}' gerado com {len(metricas_para_relatorio)} métricas.")
+    except Exception as e:
+        print(f"💥 Erro ao salvar o relatório '{caminho_relatorio}': {e}")
+
+    tempo_fim = time.time()
+    print(f"⏱️ A geração do relatório HTML levou {tempo_fim - tempo_inicio:.2f} segundos.")
+
+
+# --- 6. Prévia Aproximada por Amostragem de Blocos ---
+
+COLUNAS_PREVIA = [
+    'sigla_tribunal', 'ramo_justica', COLUNA_CASOS_JULGADOS_2025, COLUNA_CASOS_NOVOS_2025,
+    COLUNA_CASOS_DESSOBRESTADOS_2025, COLUNA_CASOS_SUSPENSOS_2025
+]
+COLUNAS_SOMA_PREVIA = COLUNAS_PREVIA[2:]
+
+def _preparar_amostragem(arquivo: str) -> Optional[Dict]:
+    """
+    Lê o cabeçalho do arquivo e sorteia a ordem em que seus blocos de bytes serão amostrados.
+    Devolve None para arquivos sem dados, que ficam fora da prévia.
+    """
+    with open(arquivo, 'rb') as f:
+        cabecalho = f.readline()
+        inicio_dados = f.tell()
+    tamanho = os.path.getsize(arquivo)
+    if tamanho <= inicio_dados:
+        print(f"😬 Alerta! O arquivo '{os.path.basename(arquivo)}' não tem dados e vai ficar fora da prévia.")
+        return None
+    try:
+        plano = _obter_plano_leitura(arquivo)
+    except Exception as e:
+        print(f"🚨 Erro ao detectar o formato de '{os.path.basename(arquivo)}': {e}. Ele vai ficar fora da prévia.")
+        return None
+    total_blocos = max(1, math.ceil((tamanho - inicio_dados) / TAMANHO_BLOCO_PREVIA))
+    ordem_blocos = list(range(total_blocos))
+    random.shuffle(ordem_blocos)
+    return {
+        'arquivo': arquivo, 'cabecalho': cabecalho, 'inicio_dados': inicio_dados, 'tamanho': tamanho,
+        'total_blocos': total_blocos, 'blocos_lidos': 0, 'blocos_pendentes': ordem_blocos,
+        'totais_blocos': [], 'plano': plano, 'excluido': False,
+    }
+
+def _ler_bloco(estado: Dict, indice_bloco: int) -> bytes:
+    """
+    Lê as linhas de um bloco sem percorrer o resto do arquivo. Uma linha pertence ao
+    bloco em que começa, então ler todos os blocos equivale a ler o arquivo inteiro.
+    """
+    inicio = estado['inicio_dados'] + indice_bloco * TAMANHO_BLOCO_PREVIA
+    fim = min(inicio + TAMANHO_BLOCO_PREVIA, estado['tamanho'])
+    with open(estado['arquivo'], 'rb') as f:
+        # Volta um byte e descarta o restante da linha que começou no bloco anterior
+        f.seek(inicio - 1)
+        f.readline()
+        posicao = f.tell()
+        if posicao >= fim:
+            return b''
+        dados = f.read(fim - posicao)
+        if not dados.endswith(b'\n'):
+            dados += f.readline()
+    return dados
+
+def _ler_bloco_previa(estado: Dict, dados: bytes) -> pd.DataFrame:
+    """Faz o parse de um bloco com o plano do arquivo, com as mesmas correções de plano de _ler_csv."""
+    while True:
+        try:
+            return pd.read_csv(io.BytesIO(estado['cabecalho'] + dados), **_argumentos_read_csv(estado['plano']),
+                               usecols=lambda coluna: coluna in COLUNAS_PREVIA)
+        except (ValueError, TypeError) as erro:
+            ajuste = _corrigir_plano_leitura(estado['plano'], erro, os.path.basename(estado['arquivo']))
+            if ajuste is None:
+                raise
+            print(f"😬 Alerta! {ajuste}")
+            _publicar_plano_leitura(estado['arquivo'], estado['plano'])
+
+def _amostrar_arquivo(estado: Dict, quantidade_blocos: int) -> Dict:
+    """
+    Lê mais alguns blocos sorteados do arquivo e guarda os totais por tribunal de cada um.
+    Se o arquivo não puder ser amostrado, ele é marcado como excluído e sai da prévia.
+    """
+    lote = estado['blocos_pendentes'][:quantidade_blocos]
+    del estado['blocos_pendentes'][:quantidade_blocos]
+
+    try:
+        for indice_bloco in lote:
+            dados = _ler_bloco(estado, indice_bloco)
+            estado['blocos_lidos'] += 1
+            if not dados.strip():
+                continue
+            df_bloco = _ler_bloco_previa(estado, dados)
+            agregacoes = {coluna: 'sum' for coluna in COLUNAS_SOMA_PREVIA}
+            agregacoes['ramo_justica'] = 'first'
+            totais = df_bloco.groupby('sigla_tribunal').agg(agregacoes)
+            totais['arquivo'] = estado['arquivo']
+            estado['totais_blocos'].append(totais)
+    except Exception as e:
+        print(f"🚨 Erro ao amostrar '{os.path.basename(estado['arquivo'])}' para a prévia: {e}. Ele vai ficar de fora.")
+        estado['excluido'] = True
+        estado['blocos_pendentes'].clear()
+        estado['totais_blocos'].clear()
+    return estado
+
+def _margem_relativa_razao(df_tribunal: pd.DataFrame, y: pd.Series, x: pd.Series,
+                           blocos_por_arquivo: Dict[str, Tuple[int, int]]) -> float:
+    """
+    Meia-largura relativa do intervalo de confiança da razão Σy / Σx.
+
+    Usa o estimador de razão combinado da amostragem estratificada por conglomerados
+    (estrato = arquivo, conglomerado = bloco). Blocos lidos em que o tribunal não aparece
+    entram como zero. Arquivos lidos por completo não contribuem para a variância.
+    """
+    total_blocos = df_tribunal['arquivo'].map(lambda arquivo: blocos_por_arquivo[arquivo][0])
+    blocos_lidos = df_tribunal['arquivo'].map(lambda arquivo: blocos_por_arquivo[arquivo][1])
+    peso = total_blocos / blocos_lidos
+    y_estimado = (y * peso).sum()
+    x_estimado = (x * peso).sum()
+    if x_estimado == 0:
+        return float('nan')
+    razao = y_estimado / x_estimado
+
+    variancia = 0.0
+    desvios = y - razao * x
+    for arquivo, desvios_arquivo in desvios.groupby(df_tribunal['arquivo']):
+        total_h, lidos_h = blocos_por_arquivo[arquivo]
+        if lidos_h >= total_h:
+            continue
+        if lidos_h < 2:
+            return float('inf')
+        s2 = ((desvios_arquivo ** 2).sum() - desvios_arquivo.sum() ** 2 / lidos_h) / (lidos_h - 1)
+        variancia += total_h ** 2 * (1 - lidos_h / total_h) * s2 / lidos_h
+
+    if variancia == 0:
+        return 0.0
+    if razao == 0:
+        return float('inf')
+    return Z_CONFIANCA_PREVIA * math.sqrt(variancia) / abs(x_estimado * razao)
+
+def _estimar_metas_previa(estados: List[Dict]) -> pd.DataFrame:
+    """Estima cada Meta por tribunal, com intervalo de confiança, a partir dos blocos já lidos."""
+    lista_totais = [totais for estado in estados for totais in estado['totais_blocos']]
+    if not lista_totais:
+        return pd.DataFrame()
+    df_totais = pd.concat(lista_totais).reset_index()
+    blocos_por_arquivo = {estado['arquivo']: (estado['total_blocos'], estado['blocos_lidos']) for estado in estados}
+
+    linhas = []
+    for sigla_tribunal, df_tribunal in df_totais.groupby('sigla_tribunal'):
+        ramo_justica = df_tribunal['ramo_justica'].iloc[0]
+        peso = df_tribunal['arquivo'].map(lambda arquivo: blocos_por_arquivo[arquivo][0] / blocos_por_arquivo[arquivo][1])
+
+        # As calculadoras de cada ramo são reaproveitadas sobre os totais expandidos da amostra
+        df_estimado = pd.DataFrame([{coluna: (df_tribunal[coluna] * peso).sum() for coluna in COLUNAS_SOMA_PREVIA}])
+        funcao_calculadora = CALCULADORAS_METRICAS.get(ramo_justica)
+        if funcao_calculadora:
+            metricas_estimadas = funcao_calculadora(df_estimado)
+        else:
+            metricas_estimadas = {'Meta1': calcular_metrica_tipo_1(df_estimado)}
+
+        julgados = df_tribunal[COLUNA_CASOS_JULGADOS_2025]
+        distribuidos = df_tribunal[COLUNA_CASOS_NOVOS_2025] - df_tribunal[COLUNA_CASOS_SUSPENSOS_2025]
+        margem_tipo_1 = _margem_relativa_razao(
+            df_tribunal, julgados, distribuidos + df_tribunal[COLUNA_CASOS_DESSOBRESTADOS_2025], blocos_por_arquivo)
+        margem_generica = _margem_relativa_razao(df_tribunal, julgados, distribuidos, blocos_por_arquivo)
+
+        for nome_metrica, estimativa in metricas_estimadas.items():
+            if isinstance(estimativa, str):
+                estimativa, margem_erro = float('nan'), float('nan')
+            else:
+                # Apenas a Meta1 usa a fórmula do tipo 1; as demais são múltiplos da razão genérica
+                margem_relativa = margem_tipo_1 if nome_metrica == 'Meta1' else margem_generica
+                margem_erro = abs(estimativa) * margem_relativa
+            linhas.append({
+                'tribunal': sigla_tribunal, 'ramo_justica': ramo_justica, 'meta': nome_metrica,
+                'estimativa': estimativa, 'margem_erro': margem_erro,
+                'limite_inferior': estimativa - margem_erro, 'limite_superior': estimativa + margem_erro,
+            })
+    return pd.DataFrame(linhas)
+
+def gerar_previa_metas(caminho_fonte: str, caminho_saida_arquivo: str) -> Optional[pd.DataFrame]:
+    """
+    Estima as Metas de cada tribunal lendo blocos aleatórios dos CSVs, sem o parse completo.
+    A cada rodada mais blocos são lidos dos arquivos cujos tribunais ainda estão acima da
+    margem de erro alvo, até atingi-la ou até ler os arquivos inteiros.
+    """
+    tempo_inicio = time.time()
+    arquivos_csv = glob.glob(os.path.join(caminho_fonte, "teste_*.csv"))
+    if not arquivos_csv:
+        print(f"🤔 Opa! Não achei nenhum arquivo CSV com o padrão 'teste_*.csv' em '{caminho_fonte}' para a prévia.")
+        return None
+
+    estados = [estado for estado in map(_preparar_amostragem, arquivos_csv) if estado is not None]
+    pendentes = estados
+    df_previa = pd.DataFrame()
+    rodada = 0
+
+    while pendentes:
+        rodada += 1
+        with concurrent.futures.ThreadPoolExecutor() as executor:
+            list(executor.map(lambda estado: _amostrar_arquivo(estado, BLOCOS_POR_RODADA_PREVIA), pendentes))
+
+        estados = [estado for estado in estados if not estado['excluido']]
+        if not estados:
+            break
+        df_previa = _estimar_metas_previa(estados)
+        if df_previa.empty:
+            tribunais_imprecisos = set()
+        else:
+            tribunais_imprecisos = set(df_previa.loc[df_previa['margem_erro'] > MARGEM_ERRO_ALVO_PREVIA, 'tribunal'])
+
+        blocos_lidos = sum(estado['blocos_lidos'] for estado in estados)
+        total_blocos = sum(estado['total_blocos'] for estado in estados)
+        print(f"🔭 Prévia (rodada {rodada}): {100 * blocos_lidos / total_blocos:.1f}% dos blocos lidos, "
+              f"{len(tribunais_imprecisos)} tribunais ainda acima da margem de erro alvo.")
+
+        pendentes = [
+            estado for estado in estados
+            if estado['blocos_pendentes']
+            and not tribunais_imprecisos.isdisjoint(set().union(*(totais.index for totais in estado['totais_blocos'])))
+        ]
+
+    _salvar_planos_leitura()
+    if not estados:
+        print("❌ Nenhum arquivo pôde ser amostrado. Não há prévia para mostrar.")
+        return None
+
+    try:
+        df_previa.to_csv(caminho_saida_arquivo, index=False, sep=',', encoding='utf-8')
+        print(f"✅ Prévia das métricas salva em '{caminho_saida_arquivo}'.")
+    except Exception as e:
+        print(f"💥 Erro: Não foi possível salvar a prévia das métricas em '{caminho_saida_arquivo}': {e}")
+
+    tempo_fim = time.time()
+    print(f"⏱️ A prévia por amostragem levou {tempo_fim - tempo_inicio:.2f} segundos.")
+    return df_previa
+
 
 # --- Bloco de Execução Principal ---
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Pipeline paralelo de cálculo das Metas dos tribunais.")
+    parser.add_argument('--max-memory', default=MEMORIA_MAXIMA, type=_converter_tamanho_memoria,
+                        help="Orçamento de memória para a leitura dos CSVs (ex.: 4G, 512M). "
+                             "Padrão: 75%% da memória livre.")
+    argumentos = parser.parse_args()
+    orcamento_memoria = argumentos.max_memory or _memoria_livre_padrao()
+
     tempo_inicio_total = time.time()
     print("--- 🚀 Começando o Pipeline de Processamento de Dados (Versão Corrigida)! ---")
 
@@ -368,16 +1136,29 @@ if __name__ == "__main__":
 
     caminho_consolidado = os.path.join(DIRETORIO_SAIDA, NOME_ARQUIVO_CONSOLIDADO)
     caminho_resumo_metricas = os.path.join(DIRETORIO_SAIDA, NOME_ARQUIVO_RESUMO_METAS)
+    caminho_previa_metricas = os.path.join(DIRETORIO_SAIDA, NOME_ARQUIVO_PREVIA_METAS)
 
     # Passo 1: Consolidar dados dos CSVs de origem em paralelo
-    dados_consolidados = consolidar_arquivos_csv_paralelo(DIRETORIO_DADOS_FONTE, caminho_consolidado)
+    if MODO_PREVIA:
+        # A consolidação exata segue em segundo plano enquanto a prévia é calculada
+        with concurrent.futures.ThreadPoolExecutor(max_workers=1) as executor_exato:
+            futuro_consolidado = executor_exato.submit(consolidar_arquivos_csv_paralelo,
+                                                       DIRETORIO_DADOS_FONTE, caminho_consolidado, orcamento_memoria)
+            gerar_previa_metas(DIRETORIO_DADOS_FONTE, caminho_previa_metricas)
+            dados_consolidados = futuro_consolidado.result()
+    else:
+        dados_consolidados = consolidar_arquivos_csv_paralelo(DIRETORIO_DADOS_FONTE, caminho_consolidado,
+                                                              orcamento_memoria)
 
     # Passo 2: Processar dados e calcular todas as métricas em paralelo
     dados_resumo_metricas = processar_dados_tribunais_paralelo(dados_consolidados, caminho_resumo_metricas)
 
     # Passo 3: Gerar gráficos visuais de forma sequencial para evitar erros
     if dados_resumo_metricas is not None:
-        gerar_graficos_resumo(dados_resumo_metricas, DIRETORIO_SAIDA)
+        if FORMATO_GRAFICOS == "html":
+            gerar_relatorio_html(dados_resumo_metricas, DIRETORIO_SAIDA)
+        else:
+            gerar_graficos_resumo(dados_resumo_metricas, DIRETORIO_SAIDA)
     else:
         print("🤔 O resumo de métricas não foi gerado, então não posso criar os gráficos.")
 